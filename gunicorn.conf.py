@@ -0,0 +1,18 @@
+# Configuração do gunicorn: schema e aquecimento no master, pools por worker após o fork
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv('WEB_CONCURRENCY', '2'))
+preload_app = True
+
+
+def on_starting(server):
+    """Executado uma vez no master, antes de criar os workers"""
+    import main
+    main.warm_up(server.app.wsgi())
+
+
+def post_fork(server, worker):
+    """Executado em cada worker logo após o fork, antes de aceitar requisições"""
+    import main
+    main.init_worker(server.app.wsgi())
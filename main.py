@@ -3,9 +3,13 @@ import sys
 import threading
 import subprocess
 import time
-from flask import Flask, send_from_directory, jsonify, request
+import fcntl
+from contextlib import contextmanager
+from flask import Flask, Blueprint, current_app, g, send_from_directory, jsonify, request
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.orm import configure_mappers
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from datetime import datetime, timedelta, time as dt_time
 import json
 import enum
@@ -13,24 +17,20 @@ import requests
 import schedule
 import base64
 import logging
+import sqlite3
+import gzip
+import shutil
+import tempfile
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Criar aplicação Flask
-app = Flask(__name__, static_folder='static')
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+# Extensões sem app - ligadas em create_app()
+db = SQLAlchemy()
 
-# Habilitar CORS
-CORS(app, origins="*")
-
-# Configuração do banco de dados
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sistema_aviso.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Inicializar banco
-db = SQLAlchemy(app)
+# Rotas registradas na aplicação por create_app()
+api = Blueprint('api', __name__)
 
 # ==================== MODELOS ====================
 
@@ -152,6 +152,175 @@ class WhatsAppConfig(db.Model):
             'updated_at': self.updated_at.isoformat()
         }
 
+class ExpiryRollup(db.Model):
+    __tablename__ = 'expiry_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'product_type', 'plan', 'status', name='uq_expiry_rollup_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    product_type = db.Column(db.Enum(ProductType), nullable=False)
+    plan = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum(ClientStatus), nullable=False)
+    client_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+class PlanRollup(db.Model):
+    __tablename__ = 'plan_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('product_type', 'plan', 'status', name='uq_plan_rollup_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_type = db.Column(db.Enum(ProductType), nullable=False)
+    plan = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.Enum(ClientStatus), nullable=False)
+    client_count = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0.0)
+
+# ==================== ROLLUPS DE VENCIMENTO ====================
+
+# Status que ainda representam uma assinatura em vigor (receita em risco no vencimento)
+LIVE_STATUSES = (ClientStatus.ACTIVE, ClientStatus.RENEWED)
+
+def rollup_add_client(client):
+    """Soma o cliente ao bucket de rollup (dia, produto, plano, status)"""
+    _apply_rollup_delta(client, 1)
+
+def rollup_remove_client(client):
+    """Retira o cliente do bucket de rollup - chamar antes de alterar vencimento, plano ou status"""
+    _apply_rollup_delta(client, -1)
+
+def _apply_rollup_delta(client, sign):
+    # O incremento é feito no próprio banco para não perder atualizações de outros workers
+    status = client.status or ClientStatus.ACTIVE
+    keys = {'product_type': client.product_type, 'plan': client.plan, 'status': status}
+    
+    for model, bucket in ((ExpiryRollup, dict(keys, day=client.expiry_date)), (PlanRollup, keys)):
+        bucket_filter = [getattr(model, column) == value for column, value in bucket.items()]
+        
+        if sign > 0:
+            statement = sqlite_insert(model).values(
+                client_count=sign,
+                revenue=round(sign * client.value, 2),
+                **bucket
+            ).on_conflict_do_update(
+                index_elements=list(bucket),
+                set_={
+                    'client_count': model.client_count + sign,
+                    'revenue': db.func.round(model.revenue + sign * client.value, 2)
+                }
+            )
+            db.session.execute(statement)
+        else:
+            result = db.session.execute(
+                db.update(model).where(*bucket_filter).values(
+                    client_count=model.client_count + sign,
+                    revenue=db.func.round(model.revenue + sign * client.value, 2)
+                )
+            )
+            if result.rowcount == 0:
+                # Bucket inexistente - a reconstrução noturna corrige a divergência
+                logger.warning(f"Bucket de {model.__tablename__} ausente para o cliente {client.id}")
+            
+            db.session.execute(db.delete(model).where(*bucket_filter, model.client_count <= 0))
+
+def _expected_rollup_buckets():
+    """Calcula os buckets (diário e por plano) diretamente da tabela de clientes"""
+    rows = db.session.query(
+        Client.expiry_date,
+        Client.product_type,
+        Client.plan,
+        Client.status,
+        db.func.count(Client.id),
+        db.func.sum(Client.value)
+    ).group_by(
+        Client.expiry_date, Client.product_type, Client.plan, Client.status
+    ).all()
+    
+    # Status NULL conta como ACTIVE, então os grupos são mesclados aqui
+    day_buckets = {}
+    plan_buckets = {}
+    for day, product_type, plan, status, count, revenue in rows:
+        status = status or ClientStatus.ACTIVE
+        for buckets, key in ((day_buckets, (day, product_type, plan, status)), (plan_buckets, (product_type, plan, status))):
+            totals = buckets.setdefault(key, [0, 0.0])
+            totals[0] += count
+            totals[1] += revenue or 0.0
+    
+    return day_buckets, plan_buckets
+
+def _rollup_drift(day_buckets, plan_buckets):
+    """Lista os buckets em que os rollups gravados divergem dos valores esperados"""
+    drift = []
+    for model, expected, key_of in (
+        (ExpiryRollup, day_buckets, lambda row: (row.day, row.product_type, row.plan, row.status)),
+        (PlanRollup, plan_buckets, lambda row: (row.product_type, row.plan, row.status))
+    ):
+        stored = {key_of(row): (row.client_count, row.revenue) for row in model.query.all()}
+        for key in set(stored) | set(expected):
+            stored_count, stored_revenue = stored.get(key, (0, 0.0))
+            expected_count, expected_revenue = expected.get(key, (0, 0.0))
+            if stored_count != expected_count or abs(stored_revenue - expected_revenue) > 0.005:
+                drift.append({
+                    'table': model.__tablename__,
+                    'bucket': [part.value if isinstance(part, enum.Enum) else str(part) for part in key],
+                    'stored': {'client_count': stored_count, 'revenue': round(stored_revenue, 2)},
+                    'expected': {'client_count': expected_count, 'revenue': round(expected_revenue, 2)}
+                })
+    return drift
+
+def check_expiry_rollups():
+    """Compara os rollups incrementais com a reconstrução a partir dos clientes (requer app context)"""
+    return _rollup_drift(*_expected_rollup_buckets())
+
+def rebuild_expiry_rollups():
+    """Reconstrói todos os rollups a partir da tabela de clientes (requer app context)"""
+    try:
+        started = time.time()
+        
+        # Trava de escrita antes de ler: nenhum create/renew de outro worker pode ser
+        # confirmado entre a leitura dos clientes e a substituição dos rollups
+        db.session.execute(db.text('BEGIN IMMEDIATE'))
+        day_buckets, plan_buckets = _expected_rollup_buckets()
+        
+        drift = _rollup_drift(day_buckets, plan_buckets)
+        if drift:
+            logger.warning(f"Rollups incrementais divergentes em {len(drift)} buckets - corrigindo: {drift[:5]}")
+        
+        ExpiryRollup.query.delete()
+        PlanRollup.query.delete()
+        db.session.add_all([
+            ExpiryRollup(
+                day=day,
+                product_type=product_type,
+                plan=plan,
+                status=status,
+                client_count=count,
+                revenue=round(revenue, 2)
+            )
+            for (day, product_type, plan, status), (count, revenue) in day_buckets.items()
+        ])
+        db.session.add_all([
+            PlanRollup(
+                product_type=product_type,
+                plan=plan,
+                status=status,
+                client_count=count,
+                revenue=round(revenue, 2)
+            )
+            for (product_type, plan, status), (count, revenue) in plan_buckets.items()
+        ])
+        db.session.commit()
+        
+        logger.info(f"Rollups de vencimento reconstruídos: {len(day_buckets)} buckets em {time.time() - started:.2f}s")
+        return True
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Erro ao reconstruir rollups de vencimento: {e}")
+        return False
+
 # ==================== BACKUP GITHUB ====================
 
 class GitHubBackupService:
@@ -165,6 +334,9 @@ class GitHubBackupService:
             'Accept': 'application/vnd.github.v3+json',
             'Content-Type': 'application/json'
         }
+        # Pool de conexões HTTP reutilizado entre uploads (criado no worker, após o fork)
+        self.http = requests.Session()
+        self.http.headers.update(self.headers)
     
     def backup_all_data(self):
         """Faz backup de todos os dados do sistema"""
@@ -324,7 +496,7 @@ Este sistema está configurado para rodar completamente no Replit com:
         try:
             # Verificar se o arquivo já existe
             url = f"{self.base_url}/repos/{self.repo_name}/contents/{file_path}"
-            response = requests.get(url, headers=self.headers)
+            response = self.http.get(url)
             
             # Preparar dados para upload
             content_encoded = base64.b64encode(content.encode('utf-8')).decode('utf-8')
@@ -341,7 +513,7 @@ Este sistema está configurado para rodar completamente no Replit com:
                 data['sha'] = file_info['sha']
             
             # Fazer upload/atualização
-            response = requests.put(url, headers=self.headers, json=data)
+            response = self.http.put(url, json=data)
             
             if response.status_code in [200, 201]:
                 logger.debug(f"Arquivo {file_path} enviado com sucesso")
@@ -351,27 +523,212 @@ Este sistema está configurado para rodar completamente no Replit com:
         except Exception as e:
             logger.error(f"Erro ao fazer upload do arquivo {file_path}: {e}")
 
-# Instância global do serviço de backup
-backup_service = None
+# Serviços construídos sob demanda, uma vez por processo
+_services = {}
+_services_lock = threading.Lock()
+
+def _get_service(name, factory):
+    if name not in _services:
+        with _services_lock:
+            if name not in _services:
+                _services[name] = factory()
+    return _services[name]
+
+def get_backup_service():
+    """Retorna o serviço de backup do GitHub, inicializando-o no primeiro uso"""
+    return _get_service('github_backup', init_github_backup)
 
 def init_github_backup():
     """Inicializa o serviço de backup do GitHub"""
-    global backup_service
-    
     cl_token = os.getenv("CL_TOKEN")
     repo_name = os.getenv("GITHUB_REPO")
     
     if cl_token and repo_name:
-        backup_service = GitHubBackupService(cl_token, repo_name)
+        service = GitHubBackupService(cl_token, repo_name)
         logger.info(f"Serviço de backup GitHub inicializado para {repo_name}")
-        return backup_service
+        return service
     else:
         logger.warning("Token do GitHub não fornecido - backup desabilitado")
         return None
 
+# ==================== SNAPSHOTS LOCAIS ====================
+
+class LocalSnapshotService:
+    """Snapshots locais do banco SQLite usando a API de backup online"""
+
+    SNAPSHOT_PREFIX = 'sistema_aviso_'
+    SNAPSHOT_SUFFIX = '.db.gz'
+
+    def __init__(self, db_path, snapshot_dir, retention=24, interval_hours=1, pages_per_step=256, step_sleep=0.05):
+        if retention < 1:
+            raise ValueError("A retenção de snapshots deve ser de pelo menos 1")
+        if interval_hours < 1:
+            raise ValueError("O intervalo entre snapshots deve ser de pelo menos 1 hora")
+        
+        self.db_path = db_path
+        self.snapshot_dir = snapshot_dir
+        self.retention = retention
+        self.interval_hours = interval_hours
+        self.pages_per_step = pages_per_step
+        self.step_sleep = step_sleep
+        self._lock = threading.Lock()
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self._lock_path = os.path.join(self.snapshot_dir, '.snapshot.lock')
+
+    @contextmanager
+    def _exclusive(self):
+        """Serializa criação e rotação entre threads e entre workers do gunicorn"""
+        with self._lock, open(self._lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def create_snapshot(self):
+        """Cria um snapshot comprimido e verificado do banco"""
+        with self._exclusive():
+            started = time.time()
+            # Microssegundos e PID evitam colisão entre workers no mesmo segundo
+            timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_%f')
+            file_name = f"{self.SNAPSHOT_PREFIX}{timestamp}_{os.getpid()}{self.SNAPSHOT_SUFFIX}"
+            final_path = os.path.join(self.snapshot_dir, file_name)
+            raw_path = self._temp_path('.raw')
+            partial_path = self._temp_path('.part')
+
+            try:
+                # Copiar em blocos de páginas, liberando o banco entre os passos
+                # para não bloquear os escritores
+                source = sqlite3.connect(self.db_path)
+                target = sqlite3.connect(raw_path)
+                try:
+                    source.backup(target, pages=self.pages_per_step, sleep=self.step_sleep)
+                finally:
+                    target.close()
+                    source.close()
+
+                if not self._check_integrity(raw_path):
+                    raise RuntimeError("Falha na verificação de integridade do snapshot")
+
+                with open(raw_path, 'rb') as src, gzip.open(partial_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                # Dados coletados antes do rename: a rotação de outro worker pode removê-lo logo depois
+                info = dict(self._snapshot_info(partial_path), file_name=file_name)
+                os.replace(partial_path, final_path)
+            except Exception as e:
+                logger.error(f"Erro ao criar snapshot local: {e}")
+                return None
+            finally:
+                for path in (raw_path, partial_path):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+            self._rotate(keep=file_name)
+
+            logger.info(f"Snapshot local criado: {file_name} ({info['size_bytes']} bytes em {time.time() - started:.2f}s)")
+            return info
+
+    def verify_snapshot(self, file_name):
+        """Descomprime um snapshot e executa o integrity_check"""
+        path = self._resolve(file_name)
+        raw_path = self._temp_path('.verify')
+        try:
+            with gzip.open(path, 'rb') as src, open(raw_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            return self._check_integrity(raw_path)
+        except FileNotFoundError:
+            # Removido pela rotação de outro worker: ausente, não corrompido
+            raise FileNotFoundError(f"Snapshot {file_name} não encontrado")
+        except (OSError, EOFError, sqlite3.DatabaseError) as e:
+            logger.error(f"Snapshot {file_name} inválido: {e}")
+            return False
+        finally:
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+
+    def list_snapshots(self):
+        """Lista os snapshots existentes, do mais recente para o mais antigo"""
+        snapshots = []
+        for name in self._snapshot_names():
+            try:
+                snapshots.append(self._snapshot_info(os.path.join(self.snapshot_dir, name)))
+            except FileNotFoundError:
+                # Removido pela rotação de outro worker
+                continue
+        return snapshots
+
+    def _snapshot_names(self):
+        names = [
+            name for name in os.listdir(self.snapshot_dir)
+            if name.startswith(self.SNAPSHOT_PREFIX) and name.endswith(self.SNAPSHOT_SUFFIX)
+        ]
+        # O timestamp no nome garante a ordenação cronológica
+        return sorted(names, reverse=True)
+
+    def _temp_path(self, suffix):
+        """Cria um arquivo temporário exclusivo no diretório de snapshots"""
+        fd, path = tempfile.mkstemp(prefix='.snapshot_', suffix=suffix, dir=self.snapshot_dir)
+        os.close(fd)
+        return path
+
+    def _rotate(self, keep):
+        """Remove os snapshots além do limite de retenção, preservando o recém-criado"""
+        others = [name for name in self._snapshot_names() if name != keep]
+        for name in others[self.retention - 1:]:
+            try:
+                os.remove(os.path.join(self.snapshot_dir, name))
+                logger.info(f"Snapshot antigo removido: {name}")
+            except FileNotFoundError:
+                # Já removido pela rotação de outro worker
+                continue
+            except OSError as e:
+                logger.error(f"Erro ao remover snapshot {name}: {e}")
+
+    def _resolve(self, file_name):
+        if file_name not in self._snapshot_names():
+            raise FileNotFoundError(f"Snapshot {file_name} não encontrado")
+        return os.path.join(self.snapshot_dir, file_name)
+
+    def _snapshot_info(self, path):
+        stat = os.stat(path)
+        return {
+            'file_name': os.path.basename(path),
+            'size_bytes': stat.st_size,
+            'created_at': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+        }
+
+    @staticmethod
+    def _check_integrity(path):
+        conn = sqlite3.connect(path)
+        try:
+            result = conn.execute('PRAGMA integrity_check').fetchone()
+            return result is not None and result[0] == 'ok'
+        finally:
+            conn.close()
+
+def get_snapshot_service():
+    """Retorna o serviço de snapshots locais, inicializando-o no primeiro uso (requer app context)"""
+    return _get_service('local_snapshots', init_local_snapshots)
+
+def init_local_snapshots():
+    """Inicializa o serviço de snapshots locais (requer app context)"""
+    db_path = db.engine.url.database
+    if db.engine.url.get_backend_name() != 'sqlite' or not db_path or db_path == ':memory:':
+        logger.warning("Banco não é um arquivo SQLite - snapshots locais desabilitados")
+        return None
+
+    snapshot_dir = os.getenv("SNAPSHOT_DIR", os.path.join(current_app.instance_path, 'snapshots'))
+    try:
+        retention = int(os.getenv("SNAPSHOT_RETENTION", "24"))
+        interval_hours = int(os.getenv("SNAPSHOT_INTERVAL_HOURS", "1"))
+        service = LocalSnapshotService(db_path, snapshot_dir, retention=retention, interval_hours=interval_hours)
+    except ValueError as e:
+        logger.error(f"Configuração de snapshots inválida - snapshots locais desabilitados: {e}")
+        return None
+
+    logger.info(f"Serviço de snapshots locais inicializado em {snapshot_dir} (retenção: {retention}, intervalo: {interval_hours}h)")
+    return service
+
 # ==================== ROTAS DA API ====================
 
-@app.route('/api/clients', methods=['GET'])
+@api.route('/api/clients', methods=['GET'])
 def get_clients():
     try:
         page = request.args.get('page', 1, type=int)
@@ -415,7 +772,7 @@ def get_clients():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/clients', methods=['POST'])
+@api.route('/api/clients', methods=['POST'])
 def create_client():
     try:
         data = request.get_json()
@@ -433,9 +790,11 @@ def create_client():
         )
         
         db.session.add(client)
+        rollup_add_client(client)
         db.session.commit()
         
         # Fazer backup após criar cliente
+        backup_service = get_backup_service()
         if backup_service:
             backup_service.backup_all_data()
         
@@ -448,7 +807,7 @@ def create_client():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/clients/<int:client_id>/renew', methods=['POST'])
+@api.route('/api/clients/<int:client_id>/renew', methods=['POST'])
 def renew_client(client_id):
     try:
         data = request.get_json()
@@ -464,13 +823,16 @@ def renew_client(client_id):
             # Se ainda não venceu, renovar a partir da data atual de vencimento
             new_expiry = client.expiry_date + timedelta(days=days)
         
+        rollup_remove_client(client)
         client.expiry_date = new_expiry
         client.status = ClientStatus.RENEWED
         client.updated_at = datetime.utcnow()
+        rollup_add_client(client)
         
         db.session.commit()
         
         # Fazer backup após renovação
+        backup_service = get_backup_service()
         if backup_service:
             backup_service.backup_all_data()
         
@@ -483,7 +845,7 @@ def renew_client(client_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/clients/stats', methods=['GET'])
+@api.route('/api/clients/stats', methods=['GET'])
 def get_client_stats():
     try:
         product_type = request.args.get('product_type')
@@ -522,7 +884,83 @@ def get_client_stats():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/whatsapp/config', methods=['GET'])
+@api.route('/api/clients/forecast', methods=['GET'])
+def get_client_forecast():
+    try:
+        days = min(max(request.args.get('days', 90, type=int), 1), 365)
+        product_type = request.args.get('product_type')
+        
+        start = datetime.now().date()
+        end = start + timedelta(days=days - 1)
+        
+        # Vencimentos e receita em risco por dia e produto (lidos apenas dos rollups)
+        query = db.session.query(
+            ExpiryRollup.day,
+            ExpiryRollup.product_type,
+            db.func.sum(ExpiryRollup.client_count),
+            db.func.sum(ExpiryRollup.revenue)
+        ).filter(
+            ExpiryRollup.day >= start,
+            ExpiryRollup.day <= end,
+            ExpiryRollup.status.in_(LIVE_STATUSES)
+        )
+        if product_type:
+            query = query.filter(ExpiryRollup.product_type == ProductType(product_type))
+        
+        calendar = []
+        totals = {}
+        for day, product, count, revenue in query.group_by(
+            ExpiryRollup.day, ExpiryRollup.product_type
+        ).order_by(ExpiryRollup.day).all():
+            calendar.append({
+                'day': day.isoformat(),
+                'product_type': product.value,
+                'expiring_clients': int(count),
+                'revenue_at_risk': round(float(revenue or 0), 2)
+            })
+            product_totals = totals.setdefault(product.value, {'expiring_clients': 0, 'revenue_at_risk': 0.0})
+            product_totals['expiring_clients'] += int(count)
+            product_totals['revenue_at_risk'] = round(product_totals['revenue_at_risk'] + float(revenue or 0), 2)
+        
+        # Taxa de renovação por plano: renovados / (renovados + vencidos)
+        rates_query = db.session.query(
+            PlanRollup.product_type,
+            PlanRollup.plan,
+            PlanRollup.status,
+            PlanRollup.client_count
+        )
+        if product_type:
+            rates_query = rates_query.filter(PlanRollup.product_type == ProductType(product_type))
+        
+        plans = {}
+        for product, plan, status, count in rates_query.all():
+            entry = plans.setdefault((product.value, plan), {
+                'product_type': product.value,
+                'plan': plan,
+                **{client_status.value: 0 for client_status in ClientStatus}
+            })
+            entry[status.value] += int(count)
+        
+        renewal_rates = []
+        for entry in sorted(plans.values(), key=lambda e: (e['product_type'], e['plan'])):
+            closed = entry[ClientStatus.RENEWED.value] + entry[ClientStatus.EXPIRED.value]
+            entry['renewal_rate'] = round(entry[ClientStatus.RENEWED.value] / closed, 4) if closed else None
+            renewal_rates.append(entry)
+        
+        return jsonify({
+            'success': True,
+            'forecast': {
+                'start': start.isoformat(),
+                'end': end.isoformat(),
+                'calendar': calendar,
+                'totals': totals
+            },
+            'renewal_rates': renewal_rates
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/whatsapp/config', methods=['GET'])
 def get_whatsapp_config():
     try:
         config = WhatsAppConfig.get_or_create_config()
@@ -533,7 +971,7 @@ def get_whatsapp_config():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/whatsapp/config', methods=['PUT'])
+@api.route('/api/whatsapp/config', methods=['PUT'])
 def update_whatsapp_config():
     try:
         data = request.get_json()
@@ -568,9 +1006,10 @@ def update_whatsapp_config():
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/backup/manual', methods=['POST'])
+@api.route('/api/backup/manual', methods=['POST'])
 def manual_backup():
     try:
+        backup_service = get_backup_service()
         if backup_service:
             success = backup_service.backup_all_data()
             if success:
@@ -591,13 +1030,84 @@ def manual_backup():
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@api.route('/api/backup/snapshots', methods=['GET'])
+def list_snapshots():
+    try:
+        snapshot_service = get_snapshot_service()
+        if not snapshot_service:
+            return jsonify({
+                'success': False,
+                'error': 'Serviço de snapshots não configurado'
+            }), 500
+
+        return jsonify({
+            'success': True,
+            'snapshots': snapshot_service.list_snapshots()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/backup/snapshots', methods=['POST'])
+def create_snapshot():
+    try:
+        snapshot_service = get_snapshot_service()
+        if not snapshot_service:
+            return jsonify({
+                'success': False,
+                'error': 'Serviço de snapshots não configurado'
+            }), 500
+
+        snapshot = snapshot_service.create_snapshot()
+        if snapshot:
+            return jsonify({
+                'success': True,
+                'message': 'Snapshot criado com sucesso',
+                'snapshot': snapshot
+            })
+        else:
+            return jsonify({
+                'success': False,
+                'error': 'Falha ao criar snapshot'
+            }), 500
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/backup/snapshots/<file_name>/verify', methods=['POST'])
+def verify_snapshot(file_name):
+    try:
+        snapshot_service = get_snapshot_service()
+        if not snapshot_service:
+            return jsonify({
+                'success': False,
+                'error': 'Serviço de snapshots não configurado'
+            }), 500
+
+        valid = snapshot_service.verify_snapshot(file_name)
+        return jsonify({
+            'success': True,
+            'file_name': file_name,
+            'valid': valid
+        })
+    except FileNotFoundError as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@api.route('/api/health', methods=['GET'])
+def health():
+    return jsonify({
+        'success': True,
+        'status': 'ok' if STARTUP_METRICS['worker_ready'] else 'starting',
+        'startup': STARTUP_METRICS
+    })
+
 # ==================== SERVIR FRONTEND ====================
 
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
+@api.route('/', defaults={'path': ''})
+@api.route('/<path:path>')
 def serve_frontend(path):
     """Serve o frontend React"""
-    static_folder_path = app.static_folder
+    static_folder_path = current_app.static_folder
     if static_folder_path is None:
         return "Static folder not configured", 404
 
@@ -675,34 +1185,175 @@ def create_sample_data():
         
         for client in clients_iptv + clients_vpn:
             db.session.add(client)
+            rollup_add_client(client)
         
         db.session.commit()
         logger.info("Dados de exemplo criados com sucesso!")
 
-def run_scheduler():
+def run_github_backup():
+    backup_service = get_backup_service()
+    if backup_service:
+        backup_service.backup_all_data()
+
+def run_local_snapshot():
+    snapshot_service = get_snapshot_service()
+    if snapshot_service:
+        snapshot_service.create_snapshot()
+
+def _in_app_context(app, func):
+    """Envolve um job do scheduler no app context da aplicação"""
+    def job():
+        # Uma falha em um job não pode derrubar a thread do scheduler
+        try:
+            with app.app_context():
+                func()
+        except Exception as e:
+            logger.error(f"Erro no job agendado {func.__name__}: {e}")
+    return job
+
+# Arquivo de lock mantido aberto pelo processo que executa o scheduler
+_scheduler_lock_file = None
+
+def _acquire_scheduler_lock(app):
+    """Garante um único scheduler entre os workers do gunicorn"""
+    global _scheduler_lock_file
+    
+    os.makedirs(app.instance_path, exist_ok=True)
+    lock_file = open(os.path.join(app.instance_path, 'scheduler.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return False
+    
+    _scheduler_lock_file = lock_file
+    return True
+
+def run_scheduler(app):
     """Executa o scheduler de backup em thread separada"""
-    schedule.every(6).hours.do(lambda: backup_service.backup_all_data() if backup_service else None)
-    schedule.every().day.at("02:00").do(lambda: backup_service.backup_all_data() if backup_service else None)
+    # Configuração validada antes do lock: um valor inválido só desabilita os snapshots
+    try:
+        with app.app_context():
+            snapshot_service = get_snapshot_service()
+    except Exception as e:
+        logger.error(f"Erro ao inicializar snapshots locais - snapshots desabilitados: {e}")
+        snapshot_service = None
+    
+    # Apenas um worker agenda os jobs; os demais assumem se ele sair (ex.: restart)
+    while not _acquire_scheduler_lock(app):
+        time.sleep(300)
+    
+    logger.info(f"Scheduler de backup ativo no processo {os.getpid()}")
+    schedule.every(6).hours.do(_in_app_context(app, run_github_backup))
+    schedule.every().day.at("02:00").do(_in_app_context(app, run_github_backup))
+    if snapshot_service:
+        schedule.every(snapshot_service.interval_hours).hours.do(_in_app_context(app, run_local_snapshot))
+    schedule.every().day.at("03:00").do(_in_app_context(app, rebuild_expiry_rollups))
     
     while True:
         schedule.run_pending()
         time.sleep(300)  # Verificar a cada 5 minutos
 
-if __name__ == '__main__':
-    # Criar tabelas do banco
-    with app.app_context():
+# ==================== APP FACTORY ====================
+
+# Tempos de inicialização (ms) - as fases do master são herdadas pelos workers no fork
+STARTUP_METRICS = {
+    'pid': None,
+    'phases': {},
+    'first_request_ms': None,
+    'worker_ready': False
+}
+
+@contextmanager
+def _startup_phase(name):
+    started = time.perf_counter()
+    yield
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    STARTUP_METRICS['phases'][name] = elapsed_ms
+    logger.info(f"Fase de inicialização '{name}' concluída em {elapsed_ms} ms")
+
+def _start_request_timer():
+    g.request_started = time.perf_counter()
+
+def _record_first_request(response):
+    """Mede a latência da primeira requisição real atendida pelo worker"""
+    # Health checks do load balancer não representam o tráfego real
+    if request.endpoint == 'api.health':
+        return response
+    
+    if STARTUP_METRICS['worker_ready'] and STARTUP_METRICS['first_request_ms'] is None and 'request_started' in g:
+        STARTUP_METRICS['first_request_ms'] = round((time.perf_counter() - g.request_started) * 1000, 1)
+        logger.info(f"Primeira requisição do worker {os.getpid()} atendida em {STARTUP_METRICS['first_request_ms']} ms")
+    return response
+
+def create_app(config=None):
+    """Cria a aplicação Flask sem tocar no banco nem iniciar serviços"""
+    with _startup_phase('create_app'):
+        app = Flask(__name__, static_folder='static')
+        app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+        
+        # Configuração do banco de dados
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///sistema_aviso.db'
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        if config:
+            app.config.update(config)
+        
+        # Habilitar CORS
+        CORS(app, origins="*")
+        
+        db.init_app(app)
+        app.register_blueprint(api)
+        
+        app.before_request(_start_request_timer)
+        app.after_request(_record_first_request)
+    
+    return app
+
+def warm_up(app):
+    """Inicialização única no master (gunicorn --preload): schema, dados e rollups"""
+    with _startup_phase('warm_up'), app.app_context():
         db.create_all()
         create_sample_data()
         
-        # Inicializar backup GitHub
-        init_github_backup()
+        # Sincronizar rollups de vencimento com a tabela de clientes
+        rebuild_expiry_rollups()
+        
+        # Configurar os mappers do ORM uma vez, antes do fork
+        configure_mappers()
+        
+        # Nenhuma conexão aberta no master pode ser herdada pelos workers
+        db.session.remove()
+        db.engine.dispose()
+
+def init_worker(app):
+    """Inicialização por worker, após o fork: pools, caches, scheduler e requisição de aquecimento"""
+    with _startup_phase('init_worker'):
+        STARTUP_METRICS['pid'] = os.getpid()
+        STARTUP_METRICS['first_request_ms'] = None
+        STARTUP_METRICS['worker_ready'] = False
+        
+        # Serviços e pools do processo pai não são reaproveitados
+        _services.clear()
+        with app.app_context():
+            db.engine.dispose(close=False)
         
         # Iniciar scheduler em thread separada
-        scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
+        scheduler_thread = threading.Thread(target=run_scheduler, args=(app,), daemon=True)
         scheduler_thread.start()
-        
-        logger.info("✅ Sistema de Aviso de Vencimento iniciado!")
-        logger.info("✅ Backup GitHub configurado!")
-        logger.info("✅ Dados de exemplo criados!")
-        logger.info("✅ Scheduler de backup iniciado!")
     
+    # Aquecer pool de conexões, cache de queries e rotas antes do primeiro cliente
+    with _startup_phase('warm_request'):
+        app.test_client().get('/api/clients/stats')
+    
+    STARTUP_METRICS['worker_ready'] = True
+
+if __name__ == '__main__':
+    app = create_app()
+    warm_up(app)
+    init_worker(app)
+    
+    logger.info("✅ Sistema de Aviso de Vencimento iniciado!")
+    logger.info("✅ Schema, dados de exemplo e rollups prontos!")
+    logger.info("✅ Scheduler de backup iniciado!")
+    
+    app.run(host='0.0.0.0', port=int(os.getenv('PORT', '5000')))